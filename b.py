@@ -2,10 +2,11 @@ import logging
 import re
 import aiohttp
 import aiofiles
-import hashlib
-import json
+import xxhash
+import orjson
 import os
-import requests
+import shutil
+import tempfile
 from pyrogram import Client, filters, enums
 from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message
@@ -13,8 +14,7 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.combining import AndTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from bs4 import BeautifulSoup
+from lxml import etree
 from urllib.parse import urljoin, urlparse
 from datetime import datetime
 import pytz
@@ -35,153 +35,427 @@ SUPERGROUPS_FILE = 'authorized_supergroups.json'
 OWNER_ID = 6556141430  # Replace with your Telegram user ID
 MAX_FILE_SIZE = 45 * 1024 * 1024  # 45MB
 CHECK_INTERVAL = 30  # Minutes
+CHUNK_SIZE = 64 * 1024  # Bytes read per network chunk
+PAGE_SIZE = 4096  # Bytes per page hash used to skip re-parsing unchanged regions
+FLUSH_INTERVAL = 5  # Seconds between writes of changed data files
+MAX_CONCURRENT_CHECKS = 20  # Websites polled in parallel
 DEFAULT_TZ = pytz.timezone("Asia/Kolkata")
 
 # Supported file types
-DOCUMENT_EXTS = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt']
-IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
-AUDIO_EXTS = ['.mp3', '.wav', '.ogg']
-VIDEO_EXTS = ['.mp4', '.mov', '.avi', '.mkv']
-ALLOWED_EXTS = DOCUMENT_EXTS + IMAGE_EXTS + AUDIO_EXTS + VIDEO_EXTS
-
-# Scheduler configuration
-jobstores = {
-    'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')
+DOCUMENT_EXTS = frozenset({'.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt'})
+IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'})
+AUDIO_EXTS = frozenset({'.mp3', '.wav', '.ogg'})
+VIDEO_EXTS = frozenset({'.mp4', '.mov', '.avi', '.mkv'})
+ALLOWED_EXTS = DOCUMENT_EXTS | IMAGE_EXTS | AUDIO_EXTS | VIDEO_EXTS
+EXT_TYPES = {
+    **{ext: 'image' for ext in IMAGE_EXTS},
+    **{ext: 'audio' for ext in AUDIO_EXTS},
+    **{ext: 'video' for ext in VIDEO_EXTS},
 }
+FILE_TAGS = frozenset({'a', 'img', 'audio', 'video', 'source'})
+# Byte-level match for the same tags (an unclosed match runs to the end of the
+# window), plus tokens that switch the parser into comment or raw-text mode and
+# so can hide or reveal file tags elsewhere on the page
+PARSER_TOKEN_RE = re.compile(
+    rb'(?P<file><(?:a|img|audio|video|source)\b[^>]*>?)'
+    rb'|<!--|-->|</?(?:script|style|textarea|title|noscript|template)\b',
+    re.IGNORECASE
+)
+
+# Characters stripped from download filenames
+FILENAME_STRIP = str.maketrans('', '', '\\/*?:"<>|')
+
+# Scheduler configuration (jobs are kept in memory and rebuilt from user_data on startup)
 job_defaults = {
     'misfire_grace_time': 3600,
     'coalesce': True,
     'max_instances': 1
 }
 
-scheduler = AsyncIOScheduler(jobstores=jobstores, job_defaults=job_defaults, timezone=DEFAULT_TZ)
+scheduler = AsyncIOScheduler(job_defaults=job_defaults, timezone=DEFAULT_TZ)
+
+# Shared HTTP session (keep-alive + connection pooling), created in main()
+http_session = None
 
 # Helper functions for data management
+# ID lists are stored as JSON arrays but kept in memory as sets for O(1) lookups
 def load_json(file):
     try:
-        with open(file, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return [] if 'channel' in file or 'supergroup' in file else {}
+        with open(file, 'rb') as f:
+            data = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        data = {} if file == USER_DATA_FILE else []
+    return set(data) if isinstance(data, list) else data
+
+def write_file(payload, file):
+    tmp = file + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, file)
 
-def save_json(data, file):
-    with open(file, 'w') as f:
-        json.dump(data, f, indent=4)
+# Serializes on the event loop (a consistent snapshot) and writes in a worker thread
+async def save_json(data, file):
+    if isinstance(data, set):
+        data = sorted(data)
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    await asyncio.to_thread(write_file, payload, file)
 
 authorized_channels = load_json(CHANNELS_FILE)
 sudo_users = load_json(SUDO_USERS_FILE)
 authorized_supergroups = load_json(SUPERGROUPS_FILE)
 user_data = load_json(USER_DATA_FILE)
 
+# Writes are coalesced: mutations mark their file dirty and flush_dirty()
+# persists everything that changed every FLUSH_INTERVAL seconds
+persisted_data = {
+    CHANNELS_FILE: authorized_channels,
+    SUDO_USERS_FILE: sudo_users,
+    SUPERGROUPS_FILE: authorized_supergroups,
+    USER_DATA_FILE: user_data,
+}
+dirty_files = set()
+flush_lock = asyncio.Lock()
+
+def mark_dirty(file):
+    dirty_files.add(file)
+
+async def flush_dirty():
+    async with flush_lock:
+        for file in list(dirty_files):
+            dirty_files.discard(file)
+            try:
+                await save_json(persisted_data[file], file)
+            except Exception as e:
+                dirty_files.add(file)  # Retry on the next flush
+                logger.error(f"Saving {file} failed: {e}")
+
 # Authorization filter
+AUTHORIZATION_CHECKS = {
+    enums.ChatType.PRIVATE: lambda message: str(message.from_user.id) in sudo_users or message.from_user.id == OWNER_ID,
+    enums.ChatType.CHANNEL: lambda message: str(message.chat.id) in authorized_channels,
+    enums.ChatType.SUPERGROUP: lambda message: str(message.chat.id) in authorized_supergroups,
+}
+
 def is_authorized(_, __, message: Message):
-    if message.chat.type == enums.ChatType.PRIVATE:
-        return str(message.from_user.id) in sudo_users or message.from_user.id == OWNER_ID
-    elif message.chat.type == enums.ChatType.CHANNEL:
-        return str(message.chat.id) in authorized_channels
-    elif message.chat.type == enums.ChatType.SUPERGROUP:
-        return str(message.chat.id) in authorized_supergroups
-    return False
+    check = AUTHORIZATION_CHECKS.get(message.chat.type)
+    return check is not None and check(message)
+
+# Shared by every handler
+authorized = filters.create(is_authorized)
 
 # File handling
-async def download_file(url, custom_name=None):
+async def download_file(url, custom_name=None, directory='.'):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    return None
-                
-                # Check file size before download
-                content_length = int(response.headers.get('Content-Length', 0))
-                if content_length > MAX_FILE_SIZE:
-                    return None
-                
-                # Determine file extension
-                ext = os.path.splitext(urlparse(url).path)[1].lower()
-                content_type = response.headers.get('Content-Type', '')
-                if not ext:
-                    if 'image' in content_type:
-                        ext = '.jpg'
-                    elif 'audio' in content_type:
-                        ext = '.mp3'
-                    elif 'video' in content_type:
-                        ext = '.mp4'
-                    else:
-                        ext = '.bin'
-
-                filename = re.sub(r'[\\/*?:"<>|]', '', (custom_name or os.path.basename(urlparse(url).path)) + ext)
-                async with aiofiles.open(filename, 'wb') as f:
-                    await f.write(await response.read())
-                    if os.path.getsize(filename) > MAX_FILE_SIZE:
-                        os.remove(filename)
-                        return None
-                    return filename
+        async with http_session.get(url) as response:
+            if response.status != 200:
+                return None
+            
+            # Check file size before download
+            content_length = int(response.headers.get('Content-Length', 0))
+            if content_length > MAX_FILE_SIZE:
+                return None
+            
+            # Determine file extension
+            ext = os.path.splitext(urlparse(url).path)[1].lower()
+            content_type = response.headers.get('Content-Type', '')
+            if not ext:
+                if 'image' in content_type:
+                    ext = '.jpg'
+                elif 'audio' in content_type:
+                    ext = '.mp3'
+                elif 'video' in content_type:
+                    ext = '.mp4'
+                else:
+                    ext = '.bin'
+
+            filename = ((custom_name or os.path.basename(urlparse(url).path)) + ext).translate(FILENAME_STRIP)
+            filename = os.path.join(directory, filename)
+            total = 0
+            async with aiofiles.open(filename, 'wb') as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    total += len(chunk)
+                    if total > MAX_FILE_SIZE:
+                        break
+                    await f.write(chunk)
+            if total > MAX_FILE_SIZE:
+                os.remove(filename)
+                return None
+            return filename
     except Exception as e:
         logger.error(f"Download failed: {e}")
         return None
 
 # HTML parsing
-def extract_files(html, base_url):
-    soup = BeautifulSoup(html, 'lxml')
-    files = []
-    for tag in soup.find_all(['a', 'img', 'audio', 'video', 'source']):
-        url = tag.get('href') or tag.get('src')
+# Parser target: only sees start tags, so lxml never builds a DOM or text nodes
+class FileCollector:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.files = []
+
+    def start(self, tag, attrib):
+        if tag not in FILE_TAGS:
+            return
+        url = attrib.get('href') or attrib.get('src')
         if not url:
-            continue
-        url = urljoin(base_url, url)
-        if not any(url.lower().endswith(ext) for ext in ALLOWED_EXTS):
-            continue
-        
-        name = tag.get('alt') or tag.get('title') or os.path.basename(url)
-        file_type = 'document'
+            return
+        url = urljoin(self.base_url, url)
         ext = os.path.splitext(url)[1].lower()
-        if ext in IMAGE_EXTS:
-            file_type = 'image'
-        elif ext in AUDIO_EXTS:
-            file_type = 'audio'
-        elif ext in VIDEO_EXTS:
-            file_type = 'video'
+        if ext not in ALLOWED_EXTS:
+            return
         
-        files.append({'name': name, 'url': url, 'type': file_type})
-    return files
+        name = attrib.get('alt') or attrib.get('title') or os.path.basename(url)
+        file_type = EXT_TYPES.get(ext, 'document')
+        self.files.append({'name': name, 'url': url, 'type': file_type})
+
+    def close(self):
+        return self.files
+
+# The parser decodes the raw bytes itself; encoding is the HTTP charset, if any,
+# otherwise libxml2 detects it from the BOM or <meta charset>
+def file_parser(base_url, encoding=None):
+    try:
+        return etree.HTMLParser(target=FileCollector(base_url), encoding=encoding)
+    except LookupError:
+        # Labels libxml2 does not know, e.g. "none", "utf8mb4" or Python aliases like "utf_8"
+        return etree.HTMLParser(target=FileCollector(base_url))
+
+def is_ascii_compatible(encoding):
+    try:
+        return '<a'.encode(encoding) == b'<a'
+    except LookupError:
+        return True
+
+# Hash and parse the body in a single pass over the network chunks.
+# The body is also hashed in PAGE_SIZE pages; given the page map of the previous
+# scan, parsing is deferred until a page that holds (or held) a file tag or
+# parser-state token changes and skipped entirely if none did, in which case
+# files is returned as None. Edits that shift parser state without any of those
+# tokens are not detected, e.g. an unbalanced quote inside another tag's
+# attribute, or a changed <meta charset> or <base href>.
+async def scan_page(response, base_url, known_pages=None):
+    hasher = xxhash.xxh3_64()
+    parser = file_parser(base_url, response.charset)
+    old_hashes, old_tag_pages = known_pages or ([], [])
+    old_tag_pages = set(old_tag_pages)
+    # The byte-level tag scan only sees tags in ASCII-compatible bodies (not e.g. UTF-16)
+    ascii_body = response.charset is None or is_ascii_compatible(response.charset)
+    parsing = known_pages is None or not ascii_body
+    pending = []
+    page_hashes, tag_pages = [], []
+    tag_count = 0
+    previous = b''
+    previous_changed = False
+
+    def start_parsing():
+        nonlocal parsing
+        parsing = True
+        for page in pending:
+            parser.feed(page)
+        pending.clear()
+
+    def scan(page):
+        nonlocal previous, previous_changed, tag_count, ascii_body
+        index = len(page_hashes)
+        if b'\x00' in page:  # UTF-16/32 encode ASCII characters with NUL bytes
+            ascii_body = False
+            if not parsing:
+                start_parsing()
+        page_hash = xxhash.xxh3_64_hexdigest(page)
+        page_hashes.append(page_hash)
+        
+        # Include the previous page so tokens straddling the boundary count on both pages
+        has_tags = straddles = False
+        for match in PARSER_TOKEN_RE.finditer(previous + page):
+            if match.end() > len(previous):
+                has_tags = True
+                if match.start() < len(previous):
+                    straddles = True
+                elif match.lastgroup == 'file':
+                    tag_count += 1
+        if straddles and (not tag_pages or tag_pages[-1] != index - 1):
+            tag_pages.append(index - 1)
+        if has_tags:
+            tag_pages.append(index)
+        
+        changed = index >= len(old_hashes) or old_hashes[index] != page_hash
+        significant = has_tags or index in old_tag_pages
+        if not parsing and (changed and significant or straddles and previous_changed):
+            start_parsing()
+        if parsing:
+            parser.feed(page)
+        else:
+            pending.append(page)
+        previous, previous_changed = page, changed
+
+    buffer = bytearray()
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        hasher.update(chunk)
+        buffer += chunk
+        offset = 0
+        while len(buffer) - offset >= PAGE_SIZE:
+            scan(bytes(buffer[offset:offset + PAGE_SIZE]))
+            offset += PAGE_SIZE
+        del buffer[:offset]
+    if buffer:
+        scan(bytes(buffer))
+    
+    # Pages cut off the end of the body may have held file tags
+    if not parsing and any(index >= len(page_hashes) for index in old_tag_pages):
+        start_parsing()
+    if not parsing:
+        return hasher.hexdigest(), None, (page_hashes, tag_pages)
+    
+    # lxml raises on close() when it was never fed, e.g. for an empty body
+    if not page_hashes:
+        return hasher.hexdigest(), [], (page_hashes, tag_pages)
+    
+    # Only keep the page map when the byte-level scan could read the body and
+    # found at least one tag per file the parser found
+    files = parser.close()
+    page_map = (page_hashes, tag_pages) if ascii_body and tag_count >= len(files) else (None, None)
+    return hasher.hexdigest(), files, page_map
 
 # Website monitoring
-async def check_single_website(client: Client, url: str, user_id: int):
+# Page maps from the last scan of each URL: url -> (body hash, page hashes, tag pages).
+# Only a parse cache, so it is kept in memory; after a restart the first poll parses.
+page_maps = {}
+
+# Each URL is fetched and parsed once per tick; the result is shared by every subscriber
+async def check_single_website(client: Client, url: str, user_ids):
+    download_dir = None
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        current_hash = hashlib.sha256(response.content).hexdigest()
-        
-        user_str = str(user_id)
-        if user_str not in user_data or url not in user_data[user_str]['tracked_urls']:
-            return
-        
-        tracked = user_data[user_str]['tracked_urls'][url]
-        if current_hash == tracked['hash']:
+        subscribers = []
+        for user_id in user_ids:
+            user_str = str(user_id)
+            if user_str in user_data and url in user_data[user_str]['tracked_urls']:
+                subscribers.append((user_id, user_data[user_str]['tracked_urls'][url]))
+        if not subscribers:
             return
         
-        # Process updates
-        new_files = extract_files(response.text, url)
-        previous_files = tracked.get('files', [])
-        tracked['hash'] = current_hash
-        tracked['files'] = [f['url'] for f in new_files]
-        save_json(user_data, USER_DATA_FILE)
-        
-        # Generate and send updates
-        summary = []
-        for file in new_files:
-            if file['url'] not in previous_files:
-                filename = await download_file(file['url'], file['name'])
-                if filename:
-                    await client.send_document(user_id, filename, caption=f"{file['name']} ({file['type']})")
-                    os.remove(filename)
-                    summary.append(f"{file['name']} ({file['type']})")
-        
-        if summary:
-            summary_text = "New files:\n" + "\n".join(summary)
-            await client.send_message(user_id, f"Website updated: {url}\n{summary_text}")
+        # Conditional request: a 304 skips download, hashing and parsing.
+        # Validators are only sent when every subscriber holds the same ones.
+        headers = {}
+        etags = {tracked.get('etag') for _, tracked in subscribers}
+        if len(etags) == 1 and None not in etags:
+            headers['If-None-Match'] = etags.pop()
+        last_modified = {tracked.get('last_modified') for _, tracked in subscribers}
+        if len(last_modified) == 1 and None not in last_modified:
+            headers['If-Modified-Since'] = last_modified.pop()
+        
+        # The page map lets scan_page skip parsing, but only if every subscriber's
+        # stored files come from the body the map was built from
+        known_pages = None
+        if url in page_maps:
+            map_hash, map_page_hashes, map_tag_pages = page_maps[url]
+            if all(tracked['hash'] == map_hash for _, tracked in subscribers):
+                known_pages = (map_page_hashes, map_tag_pages)
+        
+        async with http_session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return
+            response.raise_for_status()
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            current_hash, new_files, (page_hashes, tag_pages) = await scan_page(response, url, known_pages)
+        if page_hashes is None:
+            page_maps.pop(url, None)
+        else:
+            page_maps[url] = (current_hash, page_hashes, tag_pages)
+        
+        # Downloads are shared by all subscribers and live in a directory private
+        # to this check, so concurrent checks never touch each other's files. It is
+        # only created once something is downloaded, next to the bot rather than
+        # in a possibly RAM-backed /tmp.
+        downloads = {}  # File URL -> downloaded filename
+        for user_id, tracked in subscribers:
+            tracked.update(validators)
+            if current_hash == tracked['hash']:
+                continue
+            
+            # Process updates
+            tracked['hash'] = current_hash
+            mark_dirty(USER_DATA_FILE)
+            if new_files is None:
+                continue  # Only regions without file tags changed
+            previous_files = tracked.get('files', [])
+            tracked['files'] = [f['url'] for f in new_files]
+            
+            # Generate and send updates
+            try:
+                summary = []
+                for file in new_files:
+                    if file['url'] not in previous_files:
+                        if file['url'] not in downloads:
+                            if download_dir is None:
+                                download_dir = tempfile.mkdtemp(prefix='downloads_', dir='.')
+                            # One subdirectory per URL: links may share a name but not a path
+                            file_dir = os.path.join(download_dir, str(len(downloads)))
+                            os.mkdir(file_dir)
+                            downloads[file['url']] = await download_file(file['url'], file['name'], file_dir)
+                        filename = downloads[file['url']]
+                        if filename:
+                            await client.send_document(user_id, filename, caption=f"{file['name']} ({file['type']})")
+                            summary.append(f"{file['name']} ({file['type']})")
+                
+                if summary:
+                    summary_text = "New files:\n" + "\n".join(summary)
+                    await client.send_message(user_id, f"Website updated: {url}\n{summary_text}")
+            except Exception as e:
+                logger.error(f"Notifying {user_id} failed: {e}")
     except Exception as e:
         logger.error(f"Monitoring error: {e}")
+    finally:
+        if download_dir is not None:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+# Polling buckets: one scheduler job per (interval, night_mode) checks all of
+# its URLs concurrently instead of one job per tracked URL
+poll_buckets = {}
+check_limit = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+
+def bucket_job_id(interval, night_mode):
+    return f"poll_{interval}{'_night' if night_mode else ''}"
+
+def add_to_bucket(client: Client, user_id: int, url: str, interval: int, night_mode: bool):
+    key = (interval, night_mode)
+    job_id = bucket_job_id(interval, night_mode)
+    if key not in poll_buckets:
+        trigger = IntervalTrigger(minutes=interval)
+        if night_mode:
+            trigger = AndTrigger([trigger, CronTrigger(hour='6-22')])
+        scheduler.add_job(
+            poll_bucket,
+            trigger=trigger,
+            args=[client, interval, night_mode],
+            id=job_id,
+            replace_existing=True
+        )
+    poll_buckets.setdefault(key, set()).add((user_id, url))
+
+def remove_from_bucket(user_id: int, url: str, tracked: dict):
+    key = (tracked['interval'], tracked['night_mode'])
+    job_id = bucket_job_id(*key)
+    bucket = poll_buckets.get(key)
+    if bucket is None:
+        return
+    bucket.discard((user_id, url))
+    if not bucket:
+        del poll_buckets[key]
+        scheduler.remove_job(job_id)
+    if not any(tracked_url == url for bucket in poll_buckets.values() for _, tracked_url in bucket):
+        page_maps.pop(url, None)
+
+async def poll_bucket(client: Client, interval: int, night_mode: bool):
+    async def limited_check(url, user_ids):
+        async with check_limit:
+            await check_single_website(client, url, user_ids)
+
+    subscribers = {}
+    for user_id, url in poll_buckets.get((interval, night_mode), ()):
+        subscribers.setdefault(url, []).append(user_id)
+    await asyncio.gather(*(limited_check(url, user_ids) for url, user_ids in subscribers.items()))
 
 # Bot commands
 async def start(client: Client, message: Message):
@@ -204,29 +478,21 @@ async def track(client: Client, message: Message):
         args = message.text.split()
         url, interval = args[1], int(args[2])
         night_mode = 'night' in args[3:]
+        tracked_urls = user_data.setdefault(str(message.chat.id), {}).setdefault('tracked_urls', {})
         
-        # Schedule job
-        trigger = IntervalTrigger(minutes=interval)
-        if night_mode:
-            trigger = AndTrigger([trigger, CronTrigger(hour='6-22')])
-        
-        job_id = f"{message.chat.id}_{hashlib.md5(url.encode()).hexdigest()[:6]}"
-        scheduler.add_job(
-            check_single_website,
-            trigger=trigger,
-            args=[client, url, message.chat.id],
-            id=job_id,
-            replace_existing=True
-        )
+        # Move the URL to its polling bucket (re-tracking may change the interval)
+        if url in tracked_urls:
+            remove_from_bucket(message.chat.id, url, tracked_urls[url])
+        add_to_bucket(client, message.chat.id, url, interval, night_mode)
         
         # Update user data
-        user_data.setdefault(str(message.chat.id), {}).setdefault('tracked_urls', {})[url] = {
+        tracked_urls[url] = {
             'hash': '',
             'interval': interval,
             'night_mode': night_mode,
             'files': []
         }
-        save_json(user_data, USER_DATA_FILE)
+        mark_dirty(USER_DATA_FILE)
         await message.reply_text(f"Now tracking {url} every {interval} minutes")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -245,13 +511,12 @@ async def untrack(client: Client, message: Message):
             await message.reply_text(f"Not tracking {url}")
             return
         
-        # Remove the job from the scheduler
-        job_id = f"{message.chat.id}_{hashlib.md5(url.encode()).hexdigest()[:6]}"
-        scheduler.remove_job(job_id)
+        # Stop polling the URL
+        remove_from_bucket(message.chat.id, url, user_data[user_str]['tracked_urls'][url])
         
         # Remove the URL from user data
         del user_data[user_str]['tracked_urls'][url]
-        save_json(user_data, USER_DATA_FILE)
+        mark_dirty(USER_DATA_FILE)
         
         await message.reply_text(f"Stopped tracking {url}")
     except Exception as e:
@@ -281,10 +546,10 @@ async def documents(client: Client, message: Message):
             return
         
         url = args[1]
-        response = requests.get(url)
-        response.raise_for_status()
+        async with http_session.get(url) as response:
+            response.raise_for_status()
+            _, files, _ = await scan_page(response, url)
         
-        files = extract_files(response.text, url)
         if not files:
             await message.reply_text("No files found on this website.")
             return
@@ -313,8 +578,8 @@ async def addchannel(client: Client, message: Message):
             await message.reply_text("Channel is already authorized.")
             return
         
-        authorized_channels.append(channel_id)
-        save_json(authorized_channels, CHANNELS_FILE)
+        authorized_channels.add(channel_id)
+        mark_dirty(CHANNELS_FILE)
         await message.reply_text(f"Added channel {channel_id} to authorized channels.")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -335,8 +600,8 @@ async def removechannel(client: Client, message: Message):
             await message.reply_text("Channel is not authorized.")
             return
         
-        authorized_channels.remove(channel_id)
-        save_json(authorized_channels, CHANNELS_FILE)
+        authorized_channels.discard(channel_id)
+        mark_dirty(CHANNELS_FILE)
         await message.reply_text(f"Removed channel {channel_id} from authorized channels.")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -357,8 +622,8 @@ async def addsupergroup(client: Client, message: Message):
             await message.reply_text("Supergroup is already authorized.")
             return
         
-        authorized_supergroups.append(group_id)
-        save_json(authorized_supergroups, SUPERGROUPS_FILE)
+        authorized_supergroups.add(group_id)
+        mark_dirty(SUPERGROUPS_FILE)
         await message.reply_text(f"Added supergroup {group_id} to authorized supergroups.")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -379,8 +644,8 @@ async def removesupergroup(client: Client, message: Message):
             await message.reply_text("Supergroup is not authorized.")
             return
         
-        authorized_supergroups.remove(group_id)
-        save_json(authorized_supergroups, SUPERGROUPS_FILE)
+        authorized_supergroups.discard(group_id)
+        mark_dirty(SUPERGROUPS_FILE)
         await message.reply_text(f"Removed supergroup {group_id} from authorized supergroups.")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -401,8 +666,8 @@ async def addsudo(client: Client, message: Message):
             await message.reply_text("User is already a sudo user.")
             return
         
-        sudo_users.append(user_id)
-        save_json(sudo_users, SUDO_USERS_FILE)
+        sudo_users.add(user_id)
+        mark_dirty(SUDO_USERS_FILE)
         await message.reply_text(f"Added user {user_id} to sudo users.")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -423,8 +688,8 @@ async def removesudo(client: Client, message: Message):
             await message.reply_text("User is not a sudo user.")
             return
         
-        sudo_users.remove(user_id)
-        save_json(sudo_users, SUDO_USERS_FILE)
+        sudo_users.discard(user_id)
+        mark_dirty(SUDO_USERS_FILE)
         await message.reply_text(f"Removed user {user_id} from sudo users.")
     except Exception as e:
         await message.reply_text(f"Error: {e}")
@@ -437,23 +702,42 @@ def main():
                  bot_token=os.getenv("BOT_TOKEN"))
     
     # Add all handlers with authorization
-    app.add_handler(MessageHandler(start, filters.command("start") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(track, filters.command("track") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(untrack, filters.command("untrack") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(list_urls, filters.command("list") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(documents, filters.command("documents") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(addchannel, filters.command("addchannel") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(removechannel, filters.command("removechannel") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(addsupergroup, filters.command("addsupergroup") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(removesupergroup, filters.command("removesupergroup") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(addsudo, filters.command("addsudo") & filters.create(is_authorized)))
-    app.add_handler(MessageHandler(removesudo, filters.command("removesudo") & filters.create(is_authorized)))
+    app.add_handler(MessageHandler(start, filters.command("start") & authorized))
+    app.add_handler(MessageHandler(track, filters.command("track") & authorized))
+    app.add_handler(MessageHandler(untrack, filters.command("untrack") & authorized))
+    app.add_handler(MessageHandler(list_urls, filters.command("list") & authorized))
+    app.add_handler(MessageHandler(documents, filters.command("documents") & authorized))
+    app.add_handler(MessageHandler(addchannel, filters.command("addchannel") & authorized))
+    app.add_handler(MessageHandler(removechannel, filters.command("removechannel") & authorized))
+    app.add_handler(MessageHandler(addsupergroup, filters.command("addsupergroup") & authorized))
+    app.add_handler(MessageHandler(removesupergroup, filters.command("removesupergroup") & authorized))
+    app.add_handler(MessageHandler(addsudo, filters.command("addsudo") & authorized))
+    app.add_handler(MessageHandler(removesudo, filters.command("removesudo") & authorized))
     
     # Start the bot and scheduler
     async def run():
-        await app.start()
-        scheduler.start()
-        await asyncio.Event().wait()  # Keep the bot running
+        global http_session
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=8, ttl_dns_cache=300)
+        )
+        try:
+            await app.start()
+            # Rebuild the polling jobs from the tracked URLs
+            for user_str, data in user_data.items():
+                for url, tracked in data.get('tracked_urls', {}).items():
+                    add_to_bucket(app, int(user_str), url, tracked['interval'], tracked['night_mode'])
+                    # Drop fields stored by older versions: job ids are derived from
+                    # the bucket now and page maps are kept in memory
+                    for field in ('job_id', 'page_hashes', 'tag_pages'):
+                        if tracked.pop(field, None) is not None:
+                            mark_dirty(USER_DATA_FILE)
+            scheduler.add_job(flush_dirty, 'interval', seconds=FLUSH_INTERVAL,
+                              id='flush_dirty', replace_existing=True)
+            scheduler.start()
+            await asyncio.Event().wait()  # Keep the bot running
+        finally:
+            await flush_dirty()
+            await http_session.close()
 
     # Run the bot
     try: